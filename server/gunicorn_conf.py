@@ -0,0 +1,19 @@
+"""
+Gunicorn configuration for running ContentIQ Python services in production
+
+Usage (from the server directory):
+    gunicorn -c gunicorn_conf.py main:app
+"""
+
+import os
+
+# Import the app once in the master so workers fork with it already loaded
+preload_app = True
+
+worker_class = "uvicorn_worker.UvicornWorker"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+bind = f"0.0.0.0:{os.getenv('PYTHON_PORT', '8001')}"
+
+# Each worker opens its own provider connections on startup (see main.py);
+# sockets opened in the master would be shared unsafely across forks
+raw_env = ["LLM_WARMUP=true"]
@@ -7,60 +7,116 @@ Exposes LLM, MCP, and Analytics services to Node.js backend
 import os
 import asyncio
 import logging
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import StreamingResponse
+from functools import lru_cache
+from fastapi import Depends, FastAPI, Header, HTTPException
+from fastapi.responses import Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
-import json
+from fastapi.middleware.gzip import GZipMiddleware
+from pydantic import BaseModel, ConfigDict
+from typing import List, Dict, Any, Optional, AsyncGenerator
+import msgspec
+import orjson
 
-# Import our services
-from services.llm_service import llm_service
-from services.mcp_client import mcp_client
-from services.analytics_service import analytics_service
+from config import config
+from services.request_body import msgspec_body
+from services.sse import sse_event, sse_response
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Initialize FastAPI app
-app = FastAPI(title="ContentIQ Services", version="1.0.0")
+# Interactive docs and the OpenAPI schema are only served in debug mode
+app = FastAPI(
+    title="ContentIQ Services",
+    version="1.0.0",
+    openapi_url="/openapi.json" if config.DEBUG else None,
+    docs_url="/docs" if config.DEBUG else None,
+    redoc_url=None,
+)
 
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=config.ALLOWED_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["Content-Type", "Authorization"],
 )
 
+# Compress JSON responses; a fast level keeps per-response latency low
+app.add_middleware(GZipMiddleware, minimum_size=500, compresslevel=1)
+
+# Service factories (imported lazily so unused services add no startup cost)
+@lru_cache
+def get_llm_service():
+    from services.llm_service import llm_service
+    return llm_service
+
+@lru_cache
+def get_mcp_client():
+    from services.mcp_client import mcp_client
+    return mcp_client
+
+@lru_cache
+def get_analytics_service():
+    from services.analytics_service import AnalyticsService
+    return AnalyticsService()
+
+@app.on_event("startup")
+async def startup():
+    # Open provider connections before the first request (set by gunicorn_conf.py)
+    if os.getenv("LLM_WARMUP", "false").lower() == "true":
+        await get_llm_service().warm_up()
+
+@app.on_event("shutdown")
+async def shutdown():
+    # Write out analytics events still waiting in the background queue (bounded wait)
+    await get_analytics_service().flush()
+    
+    # Persist semantic caches and close connections, if the LLM service was ever used
+    if get_llm_service.cache_info().currsize:
+        llm_service = get_llm_service()
+        llm_service.save_caches()
+        await llm_service.aclose()
+    
+    # Stop the persistent MCP process
+    if get_mcp_client.cache_info().currsize:
+        await get_mcp_client().close()
+
 # Request/Response Models
-class ChatMessage(BaseModel):
+# LLM request bodies are msgspec Structs decoded by msgspec_body (hot path)
+class ChatMessage(msgspec.Struct):
     role: str
     content: str
 
-class GenerateRequest(BaseModel):
+class GenerateRequest(msgspec.Struct):
     messages: List[ChatMessage]
     content_context: Optional[List[Dict[str, Any]]] = None
     stream: bool = False
 
-class ContentGapAnalysisRequest(BaseModel):
+class ContentGapAnalysisRequest(msgspec.Struct):
     query: str
     available_content: List[Dict[str, Any]]
 
 class CreateDraftRequest(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    
     content_type: str
     title: str
     data: Dict[str, Any]
 
 class TrackQueryRequest(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    
     session_id: str
     query: str
     response_time_ms: float
     success: bool
 
 class TrackContentGapRequest(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    
     query: str
     gap_data: Dict[str, Any]
 
@@ -71,55 +127,50 @@ async def health_check():
 
 # LLM Service Endpoints
 @app.post("/api/llm/generate")
-async def generate_response(request: GenerateRequest):
+async def generate_response(request: GenerateRequest = Depends(msgspec_body(GenerateRequest)), llm_service=Depends(get_llm_service)):
     """Generate AI response (non-streaming)"""
     try:
-        messages_dict = [{"role": msg.role, "content": msg.content} for msg in request.messages]
+        messages_dict = msgspec.to_builtins(request.messages)
         
-        response_chunks = []
+        last_chunk = None
         async for chunk in llm_service.generate_response(
             messages_dict, 
             request.content_context or [], 
             stream=False
         ):
-            response_chunks.append(chunk)
+            last_chunk = chunk
         
-        return response_chunks[-1] if response_chunks else {"error": "No response generated"}
+        return Response(
+            orjson.dumps(last_chunk or {"error": "No response generated"}),
+            media_type="application/json"
+        )
         
     except Exception as e:
         logger.error(f"LLM generation error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/llm/generate/stream")
-async def generate_response_stream(request: GenerateRequest):
+async def generate_response_stream(request: GenerateRequest = Depends(msgspec_body(GenerateRequest)), accept_encoding: str = Header(""), llm_service=Depends(get_llm_service)):
     """Generate AI response (streaming)"""
     try:
-        messages_dict = [{"role": msg.role, "content": msg.content} for msg in request.messages]
+        messages_dict = msgspec.to_builtins(request.messages)
         
-        async def stream_generator():
+        async def stream_generator() -> AsyncGenerator[bytes, None]:
             async for chunk in llm_service.generate_response(
                 messages_dict, 
                 request.content_context or [], 
                 stream=True
             ):
-                yield f"data: {json.dumps(chunk)}\n\n"
+                yield sse_event(chunk)
         
-        return StreamingResponse(
-            stream_generator(), 
-            media_type="text/event-stream",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "Access-Control-Allow-Origin": "*",
-            }
-        )
+        return sse_response(stream_generator(), accept_encoding)
         
     except Exception as e:
         logger.error(f"LLM streaming error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/llm/analyze-content-gap")
-async def analyze_content_gap(request: ContentGapAnalysisRequest):
+async def analyze_content_gap(request: ContentGapAnalysisRequest = Depends(msgspec_body(ContentGapAnalysisRequest)), llm_service=Depends(get_llm_service)):
     """Analyze content gap for a query"""
     try:
         result = await llm_service.analyze_content_gap(request.query, request.available_content)
@@ -130,7 +181,7 @@ async def analyze_content_gap(request: ContentGapAnalysisRequest):
 
 # MCP Client Endpoints
 @app.get("/api/mcp/content/{content_type}")
-async def fetch_content(content_type: str, query: Optional[str] = None):
+async def fetch_content(content_type: str, query: Optional[str] = None, mcp_client=Depends(get_mcp_client)):
     """Fetch content from Contentstack CMS"""
     try:
         result = await mcp_client.fetch_content(content_type, query or "")
@@ -140,7 +191,7 @@ async def fetch_content(content_type: str, query: Optional[str] = None):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/mcp/search")
-async def search_content(query: str, content_types: Optional[List[str]] = None):
+async def search_content(query: str, content_types: Optional[List[str]] = None, mcp_client=Depends(get_mcp_client)):
     """Search content in Contentstack CMS"""
     try:
         result = await mcp_client.search_content(query, content_types or [])
@@ -150,7 +201,7 @@ async def search_content(query: str, content_types: Optional[List[str]] = None):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/mcp/create-draft")
-async def create_draft_content(request: CreateDraftRequest):
+async def create_draft_content(request: CreateDraftRequest, mcp_client=Depends(get_mcp_client)):
     """Create draft content in Contentstack CMS"""
     try:
         result = await mcp_client.create_draft_content(
@@ -165,7 +216,7 @@ async def create_draft_content(request: CreateDraftRequest):
 
 # Analytics Service Endpoints
 @app.post("/api/analytics/track-query")
-async def track_query(request: TrackQueryRequest):
+async def track_query(request: TrackQueryRequest, analytics_service=Depends(get_analytics_service)):
     """Track a chat query"""
     try:
         await analytics_service.track_query(
@@ -180,7 +231,7 @@ async def track_query(request: TrackQueryRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/analytics/track-content-gap")
-async def track_content_gap(request: TrackContentGapRequest):
+async def track_content_gap(request: TrackContentGapRequest, analytics_service=Depends(get_analytics_service)):
     """Track a content gap"""
     try:
         await analytics_service.track_content_gap(request.query, request.gap_data)
@@ -190,7 +241,7 @@ async def track_content_gap(request: TrackContentGapRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/analytics/summary")
-async def get_analytics_summary():
+async def get_analytics_summary(analytics_service=Depends(get_analytics_service)):
     """Get analytics summary"""
     try:
         result = await analytics_service.get_analytics_summary()
@@ -200,7 +251,7 @@ async def get_analytics_summary():
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/analytics/trends")
-async def get_query_trends(days: int = 7):
+async def get_query_trends(days: int = 7, analytics_service=Depends(get_analytics_service)):
     """Get query trends"""
     try:
         result = await analytics_service.get_query_trends(days)
@@ -210,7 +261,7 @@ async def get_query_trends(days: int = 7):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/analytics/top-queries")
-async def get_top_queries(limit: int = 10):
+async def get_top_queries(limit: int = 10, analytics_service=Depends(get_analytics_service)):
     """Get top queries"""
     try:
         result = await analytics_service.get_top_queries(limit)
@@ -220,7 +271,7 @@ async def get_top_queries(limit: int = 10):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/analytics/content-gaps")
-async def get_content_gaps():
+async def get_content_gaps(analytics_service=Depends(get_analytics_service)):
     """Get content gaps"""
     try:
         result = await analytics_service.get_content_gaps()
@@ -232,4 +283,11 @@ async def get_content_gaps():
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PYTHON_PORT", "8001"))
-    uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=port,
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", "1"))
+    )
\ No newline at end of file
@@ -1,25 +1,90 @@
 import json
-import redis
+import re
+import asyncio
+from redis import asyncio as aioredis
 from datetime import datetime, timedelta
+from functools import lru_cache
+from hashlib import blake2b
 from typing import Dict, List, Optional, Any
+from collections import Counter, deque
 import os
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Query categories in priority order, one compiled pattern each
+_QUERY_CATEGORIES = [
+    (name, re.compile("|".join(map(re.escape, words))))
+    for name, words in (
+        ("Hotels", ["hotel", "accommodation", "stay"]),
+        ("Tours", ["tour", "trip", "travel"]),
+        ("Dining", ["restaurant", "food", "dining"]),
+        ("Pricing", ["price", "cost", "budget"]),
+    )
+]
+
+# In-memory retention, mirroring the Redis TTLs
+_MEMORY_DAYS = 30
+_MEMORY_GAP_CAP = 10000
+
+def _query_hash(query: str) -> str:
+    """Stable key for a query, unaffected by PYTHONHASHSEED"""
+    
+    return blake2b(query.encode("utf-8"), digest_size=16).hexdigest()
+
 class AnalyticsService:
     """Real-time analytics service with Redis caching"""
     
+    __slots__ = (
+        "redis_client",
+        "_redis_url",
+        "_redis_checked",
+        "_connect_lock",
+        "_memory_storage",
+        "_query_counters",
+        "_queue",
+        "_drain_task",
+        "_in_flight",
+    )
+    
     def __init__(self):
-        redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
+        self._redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
+        self.redis_client = None
+        self._redis_checked = False
+        self._connect_lock = asyncio.Lock()
+        # Summaries come from the per-day counters; raw queries are kept for debugging only
+        self._memory_storage = {
+            "queries": deque(maxlen=10000),
+            "queries_by_day": {},
+            "content_gaps": {}
+        }
+        # Query frequencies per day for today and yesterday, like the Redis query_freq sets
+        self._query_counters: Dict[str, Counter] = {}
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._drain_task: Optional[asyncio.Task] = None
+        self._in_flight = 0
+    
+    async def _client(self) -> Optional[aioredis.Redis]:
+        """Get the Redis client, connecting on first use (None means in-memory mode)"""
+        
+        if not self._redis_checked:
+            async with self._connect_lock:
+                if not self._redis_checked:
+                    self.redis_client = await self._connect()
+                    self._redis_checked = True
+        return self.redis_client
+    
+    async def _connect(self) -> Optional[aioredis.Redis]:
+        """Connect to Redis, falling back to in-memory storage"""
+        
         try:
-            self.redis_client = redis.from_url(redis_url, decode_responses=True)
+            client = aioredis.from_url(self._redis_url, decode_responses=True)
             # Test connection
-            self.redis_client.ping()
+            await asyncio.wait_for(client.ping(), timeout=2)
+            return client
         except Exception as e:
             logger.warning(f"Redis connection failed, using in-memory storage: {e}")
-            self.redis_client = None
-            self._memory_storage = {}
+            return None
     
     async def track_query(self, session_id: str, query: str, response_time_ms: float, success: bool):
         """Track a user query with analytics"""
@@ -34,60 +99,84 @@ class AnalyticsService:
         }
         
         # Store in Redis or memory
-        if self.redis_client:
-            # Store individual query
-            query_key = f"query:{session_id}:{timestamp.timestamp()}"
-            self.redis_client.setex(query_key, 86400, json.dumps(query_data))  # 24h TTL
-            
-            # Update aggregate stats
-            await self._update_aggregate_stats(query_data)
+        if await self._client():
+            # Written to Redis in batches by the background drain task
+            if self._drain_task is None or self._drain_task.done():
+                self._drain_task = asyncio.create_task(self._drain())
+            await self._queue.put((query_data, timestamp))
         else:
             # Memory storage fallback
-            if "queries" not in self._memory_storage:
-                self._memory_storage["queries"] = []
             self._memory_storage["queries"].append(query_data)
+            day_key = timestamp.strftime("%Y-%m-%d")
+            
+            if query:
+                counter = self._query_counters.get(day_key)
+                if counter is None:
+                    counter = self._query_counters[day_key] = Counter()
+                    while len(self._query_counters) > 2:
+                        self._query_counters.pop(next(iter(self._query_counters)))
+                counter[query] += 1
+            
+            # Per-day counters for the summary and trends
+            queries_by_day = self._memory_storage["queries_by_day"]
+            day = queries_by_day.get(day_key)
+            if day is None:
+                day = queries_by_day[day_key] = {"count": 0, "rt_sum": 0.0, "ok_count": 0}
+                while len(queries_by_day) > _MEMORY_DAYS:
+                    queries_by_day.pop(next(iter(queries_by_day)))
+            day["count"] += 1
+            day["rt_sum"] += response_time_ms
+            day["ok_count"] += 1 if success else 0
     
     async def track_content_gap(self, query: str, gap_data: Dict[str, Any]):
         """Track identified content gaps"""
         
         timestamp = datetime.now()
+        query_hash = _query_hash(query)
         gap_record = {
             "query": query,
             "gap_data": gap_data,
             "timestamp": timestamp.isoformat()
         }
         
-        if self.redis_client:
-            gap_key = f"content_gap:{hash(query)}"
-            existing = self.redis_client.get(gap_key)
+        if await self._client():
+            gap_key = f"content_gap:{query_hash}"
+            existing = await self.redis_client.get(gap_key)
             
             if existing:
                 # Increment frequency
                 existing_data = json.loads(existing)
                 existing_data["frequency"] = existing_data.get("frequency", 1) + 1
                 existing_data["last_seen"] = timestamp.isoformat()
-                self.redis_client.setex(gap_key, 86400 * 7, json.dumps(existing_data))  # 7 days TTL
+                await self.redis_client.setex(gap_key, 86400 * 7, json.dumps(existing_data))  # 7 days TTL
             else:
                 # New gap
                 gap_record["frequency"] = 1
-                self.redis_client.setex(gap_key, 86400 * 7, json.dumps(gap_record))
-        else:
-            # Memory storage
-            if "content_gaps" not in self._memory_storage:
-                self._memory_storage["content_gaps"] = {}
+                await self.redis_client.setex(gap_key, 86400 * 7, json.dumps(gap_record))
             
-            query_hash = str(hash(query))
-            if query_hash in self._memory_storage["content_gaps"]:
-                self._memory_storage["content_gaps"][query_hash]["frequency"] += 1
+            # Mirror the key TTL in the gap index so counts stay O(1)
+            await self.redis_client.zadd(
+                "content_gap_index", {gap_key: timestamp.timestamp() + 86400 * 7}
+            )
+        else:
+            # Memory storage, ordered least recently seen first for eviction
+            content_gaps = self._memory_storage["content_gaps"]
+            existing = content_gaps.pop(query_hash, None)
+            if existing is not None:
+                existing["frequency"] += 1
+                existing["last_seen"] = timestamp.isoformat()
+                content_gaps[query_hash] = existing
             else:
                 gap_record["frequency"] = 1
-                self._memory_storage["content_gaps"][query_hash] = gap_record
+                content_gaps[query_hash] = gap_record
+                if len(content_gaps) > _MEMORY_GAP_CAP:
+                    content_gaps.pop(next(iter(content_gaps)))
     
     async def get_analytics_summary(self) -> Dict[str, Any]:
         """Get real-time analytics summary"""
         
         try:
-            if self.redis_client:
+            if await self._client():
                 return await self._get_redis_analytics()
             else:
                 return await self._get_memory_analytics()
@@ -98,81 +187,65 @@ class AnalyticsService:
     async def get_query_trends(self, days: int = 7) -> List[Dict[str, Any]]:
         """Get query trends over time"""
         
-        trends = []
         end_date = datetime.now()
+        dates = [end_date - timedelta(days=i) for i in reversed(range(days))]
+        day_keys = [date.strftime("%Y-%m-%d") for date in dates]
         
-        for i in range(days):
-            date = end_date - timedelta(days=i)
-            day_key = date.strftime("%Y-%m-%d")
-            
-            if self.redis_client:
-                count = self.redis_client.get(f"daily_queries:{day_key}") or 0
-            else:
-                count = self._get_memory_daily_count(date)
-            
-            trends.append({
-                "date": day_key,
-                "queries": int(count)
-            })
+        if await self._client():
+            counts = (
+                await self.redis_client.mget([f"daily_queries:{day_key}" for day_key in day_keys])
+                if day_keys else []
+            )
+        else:
+            counts = [self._get_memory_daily_count(date) for date in dates]
         
-        return list(reversed(trends))
+        return [
+            {
+                "date": day_key,
+                "queries": int(count or 0)
+            }
+            for day_key, count in zip(day_keys, counts)
+        ]
     
     async def get_top_queries(self, limit: int = 10) -> List[Dict[str, Any]]:
         """Get most frequent queries"""
         
-        if self.redis_client:
-            # Get all query keys and count frequencies
-            query_keys = self.redis_client.keys("query:*")
-            query_counts = {}
-            
-            for key in query_keys:
-                data = json.loads(self.redis_client.get(key) or "{}")
-                query = data.get("query", "")
-                if query:
-                    query_counts[query] = query_counts.get(query, 0) + 1
-            
-            # Sort by frequency
-            sorted_queries = sorted(query_counts.items(), key=lambda x: x[1], reverse=True)
-            
-            return [
-                {
-                    "query": query,
-                    "count": count,
-                    "category": self._categorize_query(query)
-                }
-                for query, count in sorted_queries[:limit]
-            ]
+        if limit <= 0:
+            return []
+        
+        # Today and yesterday combined, so the ranking does not reset at midnight
+        now = datetime.now()
+        day_keys = [(now - timedelta(days=i)).strftime("%Y-%m-%d") for i in range(2)]
+        
+        if await self._client():
+            async with self.redis_client.pipeline(transaction=True) as pipe:
+                pipe.zunionstore("query_freq:top", [f"query_freq:{day_key}" for day_key in day_keys])
+                pipe.zrevrange("query_freq:top", 0, limit - 1, withscores=True)
+                pipe.delete("query_freq:top")
+                _, top_queries, _ = await pipe.execute()
         else:
             # Memory storage
-            queries = self._memory_storage.get("queries", [])
-            query_counts = {}
-            
-            for query_data in queries:
-                query = query_data.get("query", "")
-                if query:
-                    query_counts[query] = query_counts.get(query, 0) + 1
-            
-            sorted_queries = sorted(query_counts.items(), key=lambda x: x[1], reverse=True)
-            
-            return [
-                {
-                    "query": query,
-                    "count": count,
-                    "category": self._categorize_query(query)
-                }
-                for query, count in sorted_queries[:limit]
-            ]
+            merged = Counter()
+            for day_key in day_keys:
+                merged.update(self._query_counters.get(day_key, {}))
+            top_queries = merged.most_common(limit)
+        
+        return [
+            {
+                "query": query,
+                "count": int(count),
+                "category": self._categorize_query(query)
+            }
+            for query, count in top_queries
+        ]
     
     async def get_content_gaps(self) -> List[Dict[str, Any]]:
         """Get identified content gaps"""
         
-        if self.redis_client:
-            gap_keys = self.redis_client.keys("content_gap:*")
-            gaps = []
-            
-            for key in gap_keys:
-                gap_data = json.loads(self.redis_client.get(key) or "{}")
-                gaps.append(gap_data)
+        if await self._client():
+            gap_keys = await self._get_active_gap_keys()
+            values = await self.redis_client.mget(gap_keys) if gap_keys else []
+            gaps = [json.loads(value) for value in values if value is not None]
             
             # Sort by frequency and priority
             return sorted(gaps, key=lambda x: (
@@ -181,87 +254,139 @@ class AnalyticsService:
             ), reverse=True)
         else:
             # Memory storage
-            gaps = list(self._memory_storage.get("content_gaps", {}).values())
+            gaps = list(self._memory_storage["content_gaps"].values())
             return sorted(gaps, key=lambda x: (
                 self._priority_score(x.get("gap_data", {}).get("priority", "low")),
                 x.get("frequency", 0)
             ), reverse=True)
     
-    async def _update_aggregate_stats(self, query_data: Dict[str, Any]):
-        """Update aggregate statistics in Redis"""
+    async def _drain(self):
+        """Write queued query events to Redis, pipelining up to 500 per round-trip"""
+        
+        while True:
+            batch = [await self._queue.get()]
+            while not self._queue.empty() and len(batch) < 500:
+                batch.append(self._queue.get_nowait())
+            self._in_flight = len(batch)
+            
+            try:
+                async with self.redis_client.pipeline(transaction=False) as pipe:
+                    for query_data, timestamp in batch:
+                        self._update_aggregate_stats(pipe, query_data, timestamp)
+                    
+                    await pipe.execute()
+            except Exception as e:
+                logger.error(f"Error writing {len(batch)} tracked queries to Redis: {e}")
+            finally:
+                self._in_flight = 0
+                for _ in batch:
+                    self._queue.task_done()
+    
+    async def flush(self, timeout: float = 5):
+        """Write out queued query events and stop the drain task (called on shutdown)"""
         
-        date_key = datetime.now().strftime("%Y-%m-%d")
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.error(
+                f"Dropping {self._queue.qsize() + self._in_flight} unwritten analytics events, "
+                f"Redis did not respond within {timeout}s"
+            )
+        finally:
+            if self._drain_task is not None:
+                self._drain_task.cancel()
+    
+    def _update_aggregate_stats(self, pipe, query_data: Dict[str, Any], timestamp: datetime):
+        """Queue aggregate statistics updates on a Redis pipeline"""
+        
+        date_key = timestamp.strftime("%Y-%m-%d")
         
         # Daily query count
-        self.redis_client.incr(f"daily_queries:{date_key}")
-        self.redis_client.expire(f"daily_queries:{date_key}", 86400 * 30)  # 30 days
+        pipe.incr(f"daily_queries:{date_key}")
+        pipe.expire(f"daily_queries:{date_key}", 86400 * 30)  # 30 days
         
-        # Response time tracking
-        response_time = query_data.get("response_time_ms", 0)
-        self.redis_client.lpush(f"response_times:{date_key}", response_time)
-        self.redis_client.ltrim(f"response_times:{date_key}", 0, 999)  # Keep last 1000
-        self.redis_client.expire(f"response_times:{date_key}", 86400)
+        # Query frequency for top queries, one set per day so old counts age out
+        if query_data.get("query"):
+            freq_key = f"query_freq:{date_key}"
+            pipe.zincrby(freq_key, 1, query_data["query"])
+            pipe.expire(freq_key, 86400 * 2)
         
-        # Success rate tracking
+        # Running response time and success counters
+        stats_key = f"stats:{date_key}"
         success = 1 if query_data.get("success", False) else 0
-        self.redis_client.lpush(f"success_rate:{date_key}", success)
-        self.redis_client.ltrim(f"success_rate:{date_key}", 0, 999)
-        self.redis_client.expire(f"success_rate:{date_key}", 86400)
+        pipe.hincrbyfloat(stats_key, "rt_sum", query_data.get("response_time_ms", 0))
+        pipe.hincrby(stats_key, "rt_count", 1)
+        pipe.hincrby(stats_key, "ok_count", success)
+        pipe.expire(stats_key, 86400)
+    
+    async def _prune_gap_index(self, now: Optional[datetime] = None):
+        """Drop expired gap keys from the content gap index"""
+        
+        await self.redis_client.zremrangebyscore(
+            "content_gap_index", "-inf", (now or datetime.now()).timestamp()
+        )
+    
+    async def _get_active_gap_keys(self) -> List[str]:
+        """Get keys of content gaps that have not expired"""
+        
+        await self._prune_gap_index()
+        return await self.redis_client.zrange("content_gap_index", 0, -1)
     
     async def _get_redis_analytics(self) -> Dict[str, Any]:
         """Get analytics from Redis"""
         
-        today = datetime.now().strftime("%Y-%m-%d")
+        now = datetime.now()
+        today = now.strftime("%Y-%m-%d")
         
         # Total queries (last 7 days)
-        total_queries = 0
-        for i in range(7):
-            date = (datetime.now() - timedelta(days=i)).strftime("%Y-%m-%d")
-            daily_count = int(self.redis_client.get(f"daily_queries:{date}") or 0)
-            total_queries += daily_count
-        
-        # Average response time
-        response_times = [
-            float(x) for x in self.redis_client.lrange(f"response_times:{today}", 0, -1)
+        daily_keys = [
+            f"daily_queries:{(now - timedelta(days=i)).strftime('%Y-%m-%d')}" for i in range(7)
         ]
-        avg_response_time = sum(response_times) / len(response_times) if response_times else 0
+        total_queries = sum(int(count or 0) for count in await self.redis_client.mget(daily_keys))
         
-        # Success rate
-        success_records = [
-            int(x) for x in self.redis_client.lrange(f"success_rate:{today}", 0, -1)
-        ]
-        success_rate = (sum(success_records) / len(success_records) * 100) if success_records else 0
+        # Average response time and success rate
+        rt_sum, rt_count, ok_count = await self.redis_client.hmget(
+            f"stats:{today}", "rt_sum", "rt_count", "ok_count"
+        )
+        rt_count = int(rt_count or 0)
+        avg_response_time = float(rt_sum or 0) / rt_count if rt_count else 0
+        success_rate = (int(ok_count or 0) / rt_count * 100) if rt_count else 0
         
         # Content gaps count
-        content_gaps_count = len(self.redis_client.keys("content_gap:*"))
+        await self._prune_gap_index(now)
+        content_gaps_count = await self.redis_client.zcard("content_gap_index")
         
         return {
             "total_queries": total_queries,
             "average_response_time_ms": round(avg_response_time),
             "success_rate": round(success_rate, 1),
             "content_gaps_count": content_gaps_count,
-            "last_updated": datetime.now().isoformat()
+            "last_updated": now.isoformat()
         }
     
     async def _get_memory_analytics(self) -> Dict[str, Any]:
         """Get analytics from memory storage"""
         
-        queries = self._memory_storage.get("queries", [])
-        content_gaps = self._memory_storage.get("content_gaps", {})
+        now = datetime.now()
+        queries_by_day = self._memory_storage["queries_by_day"]
+        content_gaps = self._memory_storage["content_gaps"]
         
-        # Filter last 7 days
-        week_ago = datetime.now() - timedelta(days=7)
-        recent_queries = [
-            q for q in queries 
-            if datetime.fromisoformat(q["timestamp"]) > week_ago
-        ]
+        # Sum the per-day counters for the last 7 days
+        total_queries = 0
+        response_time_sum = 0
+        success_count = 0
         
-        total_queries = len(recent_queries)
+        for i in range(7):
+            day = queries_by_day.get((now - timedelta(days=i)).strftime("%Y-%m-%d"))
+            if day is None:
+                continue
+            total_queries += day["count"]
+            response_time_sum += day["rt_sum"]
+            success_count += day["ok_count"]
         
-        # Average response time
-        if recent_queries:
-            avg_response_time = sum(q.get("response_time_ms", 0) for q in recent_queries) / len(recent_queries)
-            success_rate = (sum(1 for q in recent_queries if q.get("success", False)) / len(recent_queries)) * 100
+        if total_queries:
+            avg_response_time = response_time_sum / total_queries
+            success_rate = success_count / total_queries * 100
         else:
             avg_response_time = 0
             success_rate = 0
@@ -271,35 +396,25 @@ class AnalyticsService:
             "average_response_time_ms": round(avg_response_time),
             "success_rate": round(success_rate, 1),
             "content_gaps_count": len(content_gaps),
-            "last_updated": datetime.now().isoformat()
+            "last_updated": now.isoformat()
         }
     
     def _get_memory_daily_count(self, date: datetime) -> int:
         """Get daily query count from memory"""
         
-        queries = self._memory_storage.get("queries", [])
-        date_str = date.strftime("%Y-%m-%d")
-        
-        return len([
-            q for q in queries
-            if datetime.fromisoformat(q["timestamp"]).strftime("%Y-%m-%d") == date_str
-        ])
+        day = self._memory_storage["queries_by_day"].get(date.strftime("%Y-%m-%d"))
+        return day["count"] if day else 0
     
-    def _categorize_query(self, query: str) -> str:
-        """Simple query categorization"""
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def _categorize_query(query: str) -> str:
+        """Simple query categorization (memoized, the mapping is pure)"""
         
         query_lower = query.lower()
-        
-        if any(word in query_lower for word in ["hotel", "accommodation", "stay"]):
-            return "Hotels"
-        elif any(word in query_lower for word in ["tour", "trip", "travel"]):
-            return "Tours"
-        elif any(word in query_lower for word in ["restaurant", "food", "dining"]):
-            return "Dining"
-        elif any(word in query_lower for word in ["price", "cost", "budget"]):
-            return "Pricing"
-        else:
-            return "General"
+        for name, pattern in _QUERY_CATEGORIES:
+            if pattern.search(query_lower):
+                return name
+        return "General"
     
     def _priority_score(self, priority: str) -> int:
         """Convert priority to numeric score"""
@@ -317,5 +432,3 @@ class AnalyticsService:
             "last_updated": datetime.now().isoformat()
         }
 
-# Global analytics service instance
-analytics_service = AnalyticsService()
@@ -1,14 +1,30 @@
 import os
-import json
+import orjson
 import asyncio
+import hashlib
 import logging
+import time
+from collections import OrderedDict
 from typing import Dict, List, Optional, Any, AsyncGenerator
 import openai
 import httpx
-from datetime import datetime
+
+from services.semcache import SemanticCache
 
 logger = logging.getLogger(__name__)
 
+_SYSTEM_PROMPT = """You are ContentIQ, an AI assistant powered by Contentstack MCP integration. 
+        You help users find information about travel content, tours, hotels, and travel guides.
+        
+        When content is found in the CMS, reference it naturally in your responses.
+        If no relevant content is found, acknowledge this and suggest what content might be helpful.
+        
+        Always be helpful, accurate, and engaging in your responses."""
+
+# Limits on the CMS content inlined into the gap analysis prompt
+_GAP_CONTENT_LIMIT = 25
+_GAP_DESCRIPTION_CHARS = 200
+
 class LLMService:
     """Multi-provider LLM service with Groq and OpenAI support"""
     
@@ -17,9 +33,23 @@ class LLMService:
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
         self.groq_base_url = "https://api.groq.com/openai/v1"
         
+        # Shared keep-alive connection pool for both providers
+        self._http = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=100,
+                max_keepalive_connections=100,
+                keepalive_expiry=30
+            ),
+            http2=True,
+            timeout=httpx.Timeout(60.0, connect=5.0)
+        )
+        
         # Initialize OpenAI client
         if self.openai_api_key:
-            self.openai_client = openai.AsyncOpenAI(api_key=self.openai_api_key)
+            self.openai_client = openai.AsyncOpenAI(
+                api_key=self.openai_api_key,
+                http_client=self._http
+            )
         else:
             self.openai_client = None
             
@@ -27,10 +57,23 @@ class LLMService:
         if self.groq_api_key:
             self.groq_client = openai.AsyncOpenAI(
                 api_key=self.groq_api_key,
-                base_url=self.groq_base_url
+                base_url=self.groq_base_url,
+                http_client=self._http
             )
         else:
             self.groq_client = None
+        
+        # Cap concurrent upstream calls at the providers' rate limits
+        self._groq_semaphore = asyncio.Semaphore(int(os.getenv("GROQ_CONCURRENCY", "20")))
+        self._openai_semaphore = asyncio.Semaphore(int(os.getenv("OPENAI_CONCURRENCY", "20")))
+        
+        # Exact-match response cache (LRU) keyed on the full prompt
+        self._cache: "OrderedDict[bytes, str]" = OrderedDict()
+        self._cache_cap = 1024
+        
+        # Similarity caches for paraphrased queries
+        self._semantic_cache = SemanticCache("responses")
+        self._gap_cache = SemanticCache("content_gaps")
     
     async def generate_response(
         self, 
@@ -43,10 +86,28 @@ class LLMService:
         # Enhance messages with content context
         enhanced_messages = self._enhance_messages_with_context(messages, content_context or [])
         
+        # Serve repeated prompts from the cache
+        cache_key = self._cache_key(enhanced_messages)
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            self._cache.move_to_end(cache_key)
+            yield {"chunk": cached, "done": True, "provider": "cache"}
+            return
+        
+        # Fall back to a similar earlier question, but only when that question is the
+        # whole prompt: follow-ups and CMS context change what the right answer is
+        query = messages[0].get("content", "") if len(messages) == 1 and not content_context else ""
+        cached = await self._semantic_cache.lookup(query)
+        if cached is not None:
+            yield {"chunk": cached, "done": True, "provider": "semcache"}
+            return
+        
         # Try Groq first, fallback to OpenAI
         try:
             if self.groq_client is not None:
-                async for chunk in self._generate_with_groq(enhanced_messages, stream):
+                async for chunk in self._cache_response(
+                    cache_key, query, self._generate_with_groq(enhanced_messages, stream)
+                ):
                     yield chunk
                 return
         except Exception as e:
@@ -55,7 +116,9 @@ class LLMService:
         # Fallback to OpenAI
         try:
             if self.openai_client is not None:
-                async for chunk in self._generate_with_openai(enhanced_messages, stream):
+                async for chunk in self._cache_response(
+                    cache_key, query, self._generate_with_openai(enhanced_messages, stream)
+                ):
                     yield chunk
                 return
         except Exception as e:
@@ -68,51 +131,70 @@ class LLMService:
             "error": True
         }
     
+    def _cache_key(self, messages: List[Dict[str, str]]) -> bytes:
+        """Hash the canonical JSON form of a message list"""
+        
+        canonical = orjson.dumps(messages, option=orjson.OPT_SORT_KEYS)
+        return hashlib.sha256(canonical).digest()
+    
+    async def _cache_response(
+        self, 
+        cache_key: bytes, 
+        query: str, 
+        chunks: AsyncGenerator[Dict[str, Any], None]
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """Pass chunks through, caching the full response once it completes"""
+        
+        parts: List[str] = []
+        async for chunk in chunks:
+            parts.append(chunk.get("chunk") or "")
+            yield chunk
+            
+            if chunk.get("done") and not chunk.get("error"):
+                response = "".join(parts)
+                self._cache[cache_key] = response
+                if len(self._cache) > self._cache_cap:
+                    self._cache.popitem(last=False)
+                await self._semantic_cache.store(query, response)
+    
     async def _generate_with_groq(
         self, 
         messages: List[Dict[str, str]], 
         stream: bool = False
     ) -> AsyncGenerator[Dict[str, Any], None]:
         """Generate response using Groq"""
-        start_time = datetime.now()
+        start_time = time.perf_counter_ns()
         
         try:
-            response = await self.groq_client.chat.completions.create(
-                model="llama3-8b-8192",
-                messages=messages,
-                temperature=0.7,
-                max_tokens=1024,
-                stream=stream
-            )
-            
-            if stream:
-                full_response = ""
-                async for chunk in response:
-                    if chunk.choices[0].delta.content:
-                        content = chunk.choices[0].delta.content
-                        full_response += content
-                        yield {
-                            "chunk": content,
-                            "done": False,
-                            "provider": "groq"
-                        }
+            async with self._groq_semaphore:
+                response = await self.groq_client.chat.completions.create(
+                    model="llama3-8b-8192",
+                    messages=messages,
+                    temperature=0.7,
+                    max_tokens=1024,
+                    stream=stream
+                )
                 
-                response_time = (datetime.now() - start_time).total_seconds() * 1000
-                yield {
-                    "chunk": "",
-                    "done": True,
-                    "response_time_ms": response_time,
-                    "provider": "groq"
-                }
-            else:
-                content = response.choices[0].message.content
-                response_time = (datetime.now() - start_time).total_seconds() * 1000
-                yield {
-                    "chunk": content,
-                    "done": True,
-                    "response_time_ms": response_time,
-                    "provider": "groq"
-                }
+                if stream:
+                    # Keep the permit until the token stream has been fully read
+                    async for chunk in response:
+                        if chunk.choices[0].delta.content:
+                            yield {
+                                "chunk": chunk.choices[0].delta.content,
+                                "done": False,
+                                "provider": "groq"
+                            }
+                    content = ""
+                else:
+                    content = response.choices[0].message.content
+            
+            response_time = (time.perf_counter_ns() - start_time) / 1_000_000
+            yield {
+                "chunk": content,
+                "done": True,
+                "response_time_ms": response_time,
+                "provider": "groq"
+            }
                 
         except Exception as e:
             logger.error(f"Groq generation error: {e}")
@@ -124,46 +206,39 @@ class LLMService:
         stream: bool = False
     ) -> AsyncGenerator[Dict[str, Any], None]:
         """Generate response using OpenAI"""
-        start_time = datetime.now()
+        start_time = time.perf_counter_ns()
         
         try:
             # the newest OpenAI model is "gpt-5" which was released August 7, 2025. do not change this unless explicitly requested by the user
-            response = await self.openai_client.chat.completions.create(
-                model="gpt-5",
-                messages=messages,
-                temperature=0.7,
-                max_tokens=1024,
-                stream=stream
-            )
-            
-            if stream:
-                full_response = ""
-                async for chunk in response:
-                    if chunk.choices[0].delta.content:
-                        content = chunk.choices[0].delta.content
-                        full_response += content
-                        yield {
-                            "chunk": content,
-                            "done": False,
-                            "provider": "openai"
-                        }
+            async with self._openai_semaphore:
+                response = await self.openai_client.chat.completions.create(
+                    model="gpt-5",
+                    messages=messages,
+                    temperature=0.7,
+                    max_tokens=1024,
+                    stream=stream
+                )
                 
-                response_time = (datetime.now() - start_time).total_seconds() * 1000
-                yield {
-                    "chunk": "",
-                    "done": True,
-                    "response_time_ms": response_time,
-                    "provider": "openai"
-                }
-            else:
-                content = response.choices[0].message.content
-                response_time = (datetime.now() - start_time).total_seconds() * 1000
-                yield {
-                    "chunk": content,
-                    "done": True,
-                    "response_time_ms": response_time,
-                    "provider": "openai"
-                }
+                if stream:
+                    # Keep the permit until the token stream has been fully read
+                    async for chunk in response:
+                        if chunk.choices[0].delta.content:
+                            yield {
+                                "chunk": chunk.choices[0].delta.content,
+                                "done": False,
+                                "provider": "openai"
+                            }
+                    content = ""
+                else:
+                    content = response.choices[0].message.content
+            
+            response_time = (time.perf_counter_ns() - start_time) / 1_000_000
+            yield {
+                "chunk": content,
+                "done": True,
+                "response_time_ms": response_time,
+                "provider": "openai"
+            }
                 
         except Exception as e:
             logger.error(f"OpenAI generation error: {e}")
@@ -176,30 +251,49 @@ class LLMService:
     ) -> List[Dict[str, str]]:
         """Enhance messages with content context from CMS"""
         
-        system_prompt = """You are ContentIQ, an AI assistant powered by Contentstack MCP integration. 
-        You help users find information about travel content, tours, hotels, and travel guides.
-        
-        When content is found in the CMS, reference it naturally in your responses.
-        If no relevant content is found, acknowledge this and suggest what content might be helpful.
-        
-        Always be helpful, accurate, and engaging in your responses."""
-        
-        if content_context:
-            context_text = "\n\nAvailable content from CMS:\n"
-            for item in content_context:
-                context_text += f"- {item.get('title', 'Untitled')}: {item.get('description', 'No description')}\n"
-            
-            system_prompt += context_text
+        # The static prompt stays first so provider prefix caching can reuse it
+        if not content_context:
+            return [{"role": "system", "content": _SYSTEM_PROMPT}, *messages]
         
-        enhanced_messages = [{"role": "system", "content": system_prompt}]
-        enhanced_messages.extend(messages)
+        parts = [_SYSTEM_PROMPT, "\n\nAvailable content from CMS:\n"]
+        parts.extend(
+            f"- {item.get('title', 'Untitled')}: {item.get('description', 'No description')}\n"
+            for item in content_context
+        )
         
-        return enhanced_messages
+        return [{"role": "system", "content": "".join(parts)}, *messages]
     
     async def analyze_content_gap(self, query: str, available_content: List[Dict[str, Any]]) -> Dict[str, Any]:
         """Analyze if query represents a content gap"""
         
+        cached = await self._gap_cache.lookup(query)
+        if cached is not None:
+            return cached
+        
         try:
+            if self.openai_client is None:
+                # Fallback analysis if no OpenAI
+                return {
+                    "is_gap": len(available_content) == 0,
+                    "priority": "medium",
+                    "suggested_content_type": "article",
+                    "suggested_title": f"Guide about {query}",
+                    "reason": "No relevant content found for this query"
+                }
+            
+            # Only titles and short descriptions matter for gap detection;
+            # descriptions may be rich-text JSON rather than strings
+            summary = []
+            for item in available_content[:_GAP_CONTENT_LIMIT]:
+                description = item.get("description") or ""
+                if not isinstance(description, str):
+                    description = orjson.dumps(description, default=str).decode()
+                summary.append({
+                    "title": item.get("title", ""),
+                    "description": description[:_GAP_DESCRIPTION_CHARS]
+                })
+            content_summary = orjson.dumps(summary, default=str).decode()
+            
             messages = [
                 {
                     "role": "system",
@@ -215,28 +309,21 @@ class LLMService:
                 },
                 {
                     "role": "user",
-                    "content": f"Query: {query}\nAvailable content: {json.dumps(available_content)}"
+                    "content": f"Query: {query}\nAvailable content: {content_summary}"
                 }
             ]
             
-            if self.openai_client is not None:
+            async with self._openai_semaphore:
                 response = await self.openai_client.chat.completions.create(
                     model="gpt-5", # the newest OpenAI model is "gpt-5" which was released August 7, 2025. do not change this unless explicitly requested by the user
                     messages=messages,
                     response_format={"type": "json_object"},
                     temperature=0.3
                 )
-                
-                return json.loads(response.choices[0].message.content)
             
-            # Fallback analysis if no OpenAI
-            return {
-                "is_gap": len(available_content) == 0,
-                "priority": "medium",
-                "suggested_content_type": "article",
-                "suggested_title": f"Guide about {query}",
-                "reason": "No relevant content found for this query"
-            }
+            result = orjson.loads(response.choices[0].message.content)
+            await self._gap_cache.store(query, result)
+            return result
             
         except Exception as e:
             logger.error(f"Content gap analysis failed: {e}")
@@ -248,5 +335,31 @@ class LLMService:
                 "reason": "Analysis failed"
             }
 
+    async def warm_up(self):
+        """Open pooled connections to each configured provider"""
+        
+        async def ping(name: str, client: openai.AsyncOpenAI):
+            try:
+                await client.models.list()
+            except Exception as e:
+                logger.warning(f"{name} warm-up failed: {e}")
+        
+        await asyncio.gather(*(
+            ping(name, client)
+            for name, client in (("Groq", self.groq_client), ("OpenAI", self.openai_client))
+            if client is not None
+        ))
+    
+    async def aclose(self):
+        """Close the shared HTTP connection pool"""
+        
+        await self._http.aclose()
+    
+    def save_caches(self):
+        """Persist the semantic caches (called on shutdown)"""
+        
+        self._semantic_cache.save()
+        self._gap_cache.save()
+
 # Global LLM service instance
 llm_service = LLMService()
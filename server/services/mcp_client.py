@@ -1,8 +1,9 @@
-import subprocess
-import json
+import orjson
 import asyncio
+import itertools
 import logging
-from typing import Dict, List, Optional, Any
+import time
+from typing import Dict, List, Optional, Any, Tuple
 import os
 
 logger = logging.getLogger(__name__)
@@ -19,9 +20,26 @@ class MCPClient:
         self.environment = os.getenv("CONTENTSTACK_ENVIRONMENT", "development")
         self.launch_project_id = os.getenv("CONTENTSTACK_LAUNCH_PROJECT_ID")
         
+        # Persistent MCP process, multiplexed with JSON-RPC request IDs; each
+        # process gets its own pending map so a dying reader only fails its own requests
+        self._proc: Optional[asyncio.subprocess.Process] = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._next_id = itertools.count(1)
+        self._start_lock = asyncio.Lock()
+        self._write_lock = asyncio.Lock()
+        self._reader_task: Optional[asyncio.Task] = None
+        self._stderr_task: Optional[asyncio.Task] = None
+        self.request_timeout = 30
+        
+        # Short-lived cache for read-only commands
+        self._cache: Dict[Tuple[str, bytes], Tuple[float, Any]] = {}
+        self._cache_maxsize = 1024
+        
     async def initialize_connection(self) -> bool:
         """Initialize MCP connection with Contentstack"""
         try:
+            await self._ensure_process()
+            
             # Test MCP connection
             result = await self._execute_mcp_command("test", {})
             return result is not None
@@ -42,7 +60,7 @@ class MCPClient:
             if query:
                 params["query"] = query
             
-            result = await self._execute_mcp_command("fetch_content", params)
+            result = await self._cached_mcp_command("fetch_content", params, ttl=60)
             return result.get("entries", []) if result else []
             
         except Exception as e:
@@ -96,35 +114,172 @@ class MCPClient:
                 "delivery_token": self.delivery_token
             }
             
-            result = await self._execute_mcp_command("get_content_types", params)
+            result = await self._cached_mcp_command("get_content_types", params, ttl=300)
             return result.get("content_types", []) if result else []
             
         except Exception as e:
             logger.error(f"Error fetching content types via MCP: {e}")
             return []
     
+    async def fetch_bundle(
+        self, 
+        content_type: str, 
+        query: Optional[str] = None, 
+        include_types: bool = True
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """Fetch entries, search results and content types concurrently"""
+        
+        async def empty() -> List[Dict[str, Any]]:
+            return []
+        
+        entries, search_results, content_types = await asyncio.gather(
+            self.fetch_content(content_type, query),
+            self.search_content(query) if query else empty(),
+            self.get_content_types() if include_types else empty()
+        )
+        
+        return {
+            "entries": entries,
+            "search_results": search_results,
+            "content_types": content_types
+        }
+    
+    async def _ensure_process(self):
+        """Start the MCP process if it is not already running"""
+        
+        async with self._start_lock:
+            if self._proc is not None and self._proc.returncode is None:
+                return
+            
+            self._proc = await asyncio.create_subprocess_exec(
+                self.mcp_command,
+                *self.mcp_args,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                limit=16 * 1024 * 1024
+            )
+            self._pending = {}
+            self._reader_task = asyncio.create_task(self._reader_loop(self._proc, self._pending))
+            self._stderr_task = asyncio.create_task(self._stderr_loop(self._proc))
+    
+    async def _reader_loop(self, proc: asyncio.subprocess.Process, pending: Dict[int, asyncio.Future]):
+        """Resolve pending requests from JSON-RPC responses on stdout"""
+        try:
+            while True:
+                # StreamReader hands back one bytes object per line, which orjson
+                # parses in place; there is no decode or intermediate copy to pool
+                line = await proc.stdout.readline()
+                if not line:
+                    break
+                
+                try:
+                    message = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    logger.warning(f"Ignoring non-JSON MCP output: {line[:200]!r}")
+                    continue
+                
+                if not isinstance(message, dict):
+                    logger.warning(f"Ignoring non-object MCP output: {line[:200]!r}")
+                    continue
+                
+                future = pending.pop(message.get("id"), None)
+                if future is None or future.done():
+                    continue
+                
+                if "error" in message:
+                    future.set_exception(RuntimeError(f"MCP error: {message['error']}"))
+                else:
+                    future.set_result(message.get("result"))
+        except Exception as e:
+            # e.g. a response line over the stream limit; the pipe is no longer framed
+            logger.error(f"MCP reader loop failed: {e}")
+        finally:
+            # Fail any requests still waiting, then reap the process so the next
+            # call starts a fresh one instead of writing to an unread pipe
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("MCP process exited"))
+            pending.clear()
+            await self._stop_process(proc, grace=1)
+    
+    async def _stderr_loop(self, proc: asyncio.subprocess.Process):
+        """Log MCP stderr so the pipe never fills up"""
+        while True:
+            line = await proc.stderr.readline()
+            if not line:
+                break
+            logger.debug(f"MCP stderr: {line.decode(errors='replace').rstrip()}")
+    
+    async def _cached_mcp_command(
+        self, 
+        command: str, 
+        params: Dict[str, Any], 
+        ttl: float
+    ) -> Optional[Dict[str, Any]]:
+        """Execute a read-only MCP command, reusing results for ttl seconds"""
+        key = (command, orjson.dumps(params, option=orjson.OPT_SORT_KEYS))
+        now = time.monotonic()
+        
+        entry = self._cache.get(key)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+        
+        result = await self._execute_mcp_command(command, params)
+        if result is not None:
+            # Re-insert so the dict stays ordered oldest-first for eviction
+            self._cache.pop(key, None)
+            self._cache[key] = (now + ttl, result)
+            if len(self._cache) > self._cache_maxsize:
+                self._cache.pop(next(iter(self._cache)))
+        
+        return result
+    
     async def _execute_mcp_command(self, command: str, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """Execute MCP command with parameters"""
+        request_id = next(self._next_id)
+        pending: Dict[int, asyncio.Future] = {}
         try:
-            cmd = [self.mcp_command] + self.mcp_args + [command, json.dumps(params)]
+            await self._ensure_process()
             
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
+            # Bind to this process so a restart cannot mix up requests and readers
+            proc, pending = self._proc, self._pending
+            future = asyncio.get_running_loop().create_future()
+            pending[request_id] = future
             
-            stdout, stderr = await process.communicate()
+            request = {"jsonrpc": "2.0", "id": request_id, "method": command, "params": params}
+            async with self._write_lock:
+                proc.stdin.write(orjson.dumps(request) + b"\n")
+                await proc.stdin.drain()
             
-            if process.returncode == 0:
-                return json.loads(stdout.decode())
-            else:
-                logger.error(f"MCP command failed: {stderr.decode()}")
-                return None
+            return await asyncio.wait_for(future, self.request_timeout)
                 
+        except asyncio.TimeoutError:
+            logger.error(f"MCP command {command} timed out after {self.request_timeout}s")
+            return None
         except Exception as e:
             logger.error(f"Error executing MCP command: {e}")
             return None
+        finally:
+            pending.pop(request_id, None)
+    
+    async def _stop_process(self, proc: asyncio.subprocess.Process, grace: float = 5):
+        """Close stdin and wait for exit, killing the process after grace seconds"""
+        if proc.returncode is not None:
+            return
+        
+        if not proc.stdin.is_closing():
+            proc.stdin.close()
+        try:
+            await asyncio.wait_for(proc.wait(), grace)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+    
+    async def close(self):
+        """Stop the MCP process"""
+        if self._proc is not None:
+            await self._stop_process(self._proc)
 
 # Global MCP client instance
 mcp_client = MCPClient()
@@ -0,0 +1,20 @@
+from typing import Callable, Type, TypeVar
+import msgspec
+from fastapi import HTTPException, Request
+
+T = TypeVar("T")
+
+def msgspec_body(model: Type[T]) -> Callable:
+    """FastAPI dependency that decodes the JSON body directly into a msgspec Struct"""
+    
+    decoder = msgspec.json.Decoder(model)
+    
+    async def decode(request: Request) -> T:
+        try:
+            return decoder.decode(await request.body())
+        except msgspec.ValidationError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        except msgspec.DecodeError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON body: {e}")
+    
+    return decode
@@ -0,0 +1,149 @@
+import os
+import json
+import asyncio
+import logging
+import threading
+from typing import Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Optional dependencies: the cache is disabled when they are not installed
+try:
+    import faiss
+    import numpy as np
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    faiss = None
+    np = None
+    SentenceTransformer = None
+
+class SemanticCache:
+    """Embedding-similarity cache that serves paraphrased queries"""
+    
+    def __init__(
+        self,
+        name: str,
+        threshold: float = 0.92,
+        model_name: str = "all-MiniLM-L6-v2",
+        max_entries: int = 1024
+    ):
+        self.name = name
+        self.threshold = threshold
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.enabled = faiss is not None and os.getenv("SEMCACHE_ENABLED", "true").lower() == "true"
+        
+        cache_dir = os.getenv("SEMCACHE_DIR")
+        self._index_path = os.path.join(cache_dir, f"{name}.faiss") if cache_dir else None
+        
+        self._model = None
+        self._index = None
+        self._responses: List[Any] = []
+        # Guards the one-off model load; embeddings themselves run unlocked in threads
+        self._load_lock = threading.Lock()
+        
+        if not self.enabled:
+            logger.info(f"Semantic cache '{name}' disabled (faiss/sentence-transformers not installed)")
+    
+    def _load(self):
+        """Load the embedding model and any persisted index (blocking, runs once)"""
+        
+        model = SentenceTransformer(self.model_name)
+        index = None
+        responses: List[Any] = []
+        
+        if self._index_path and os.path.exists(self._index_path):
+            try:
+                index = faiss.read_index(self._index_path)
+                with open(f"{self._index_path}.json") as f:
+                    responses = json.load(f)
+                logger.info(f"Loaded {len(responses)} semantic cache entries for '{self.name}'")
+            except Exception as e:
+                logger.warning(f"Failed to load semantic cache '{self.name}': {e}")
+                index = None
+                responses = []
+        
+        self._index = index if index is not None else faiss.IndexFlatIP(model.get_sentence_embedding_dimension())
+        self._responses = responses
+        self._evict()
+        
+        # Published last: other threads skip the lock once they see a model
+        self._model = model
+    
+    def _embed(self, text: str):
+        """Embed text as a normalized float32 row vector (blocking)"""
+        
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    if not self.enabled:
+                        raise RuntimeError("embedding model failed to load")
+                    try:
+                        self._load()
+                    except Exception as e:
+                        # Disable rather than retry a failed model download on every request
+                        logger.error(f"Disabling semantic cache '{self.name}', model load failed: {e}")
+                        self.enabled = False
+                        raise
+        
+        vector = self._model.encode([text], convert_to_numpy=True).astype(np.float32)
+        faiss.normalize_L2(vector)
+        return vector
+    
+    def _evict(self):
+        """Drop the oldest entries beyond max_entries"""
+        
+        excess = self._index.ntotal - self.max_entries
+        if excess > 0:
+            # Removing from a flat index shifts later ids down, keeping them aligned
+            self._index.remove_ids(np.arange(excess, dtype=np.int64))
+            del self._responses[:excess]
+    
+    async def lookup(self, text: str) -> Optional[Any]:
+        """Return the cached response for a similar query, if any"""
+        
+        if not self.enabled or not text:
+            return None
+        
+        try:
+            vector = await asyncio.to_thread(self._embed, text)
+            
+            # Search and add run on the event loop without awaiting, so they never interleave
+            if self._index.ntotal == 0:
+                return None
+            
+            similarities, ids = self._index.search(vector, 1)
+            if similarities[0][0] >= self.threshold:
+                return self._responses[ids[0][0]]
+        except Exception as e:
+            logger.warning(f"Semantic cache lookup failed: {e}")
+        
+        return None
+    
+    async def store(self, text: str, response: Any):
+        """Add a query and its response to the cache"""
+        
+        if not self.enabled or not text:
+            return
+        
+        try:
+            vector = await asyncio.to_thread(self._embed, text)
+            self._index.add(vector)
+            self._responses.append(response)
+            self._evict()
+        except Exception as e:
+            logger.warning(f"Semantic cache store failed: {e}")
+    
+    def save(self):
+        """Persist the index and responses to SEMCACHE_DIR, if configured"""
+        
+        if not self.enabled or self._index is None or not self._index_path:
+            return
+        
+        try:
+            os.makedirs(os.path.dirname(self._index_path), exist_ok=True)
+            faiss.write_index(self._index, self._index_path)
+            with open(f"{self._index_path}.json", "w") as f:
+                json.dump(self._responses, f)
+        except Exception as e:
+            logger.error(f"Failed to save semantic cache '{self.name}': {e}")
@@ -0,0 +1,72 @@
+import zlib
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict
+import orjson
+from fastapi.responses import StreamingResponse
+
+_DELTA_KEYS = {"chunk", "done", "provider"}
+
+@lru_cache(maxsize=16)
+def _delta_prefix(provider: str) -> bytes:
+    """Pre-encoded SSE envelope for a streaming delta from one provider"""
+    
+    return b'data: {"provider":' + orjson.dumps(provider) + b',"done":false,"chunk":'
+
+def sse_event(chunk: Dict[str, Any]) -> bytes:
+    """Encode a generation chunk as an SSE data frame"""
+    
+    # Plain deltas only need their content escaped into the static envelope
+    if chunk.keys() == _DELTA_KEYS and chunk["done"] is False:
+        return _delta_prefix(chunk["provider"]) + orjson.dumps(chunk["chunk"]) + b"}\n\n"
+    
+    return b"data: " + orjson.dumps(chunk) + b"\n\n"
+
+async def _gzip_events(events: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Gzip an event stream, sync-flushing after every event so none is held back"""
+    
+    compressor = zlib.compressobj(1, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    async for event in events:
+        yield compressor.compress(event) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    """Whether an Accept-Encoding header allows gzip (a q of 0 refuses it)"""
+    
+    wildcard = False
+    for token in accept_encoding.lower().split(","):
+        coding, _, params = token.partition(";")
+        coding = coding.strip()
+        if coding not in ("gzip", "*"):
+            continue
+        
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        
+        # An explicit gzip entry overrides the wildcard
+        if coding == "gzip":
+            return q > 0
+        wildcard = q > 0
+    
+    return wildcard
+
+def sse_response(events: AsyncIterator[bytes], accept_encoding: str = "") -> StreamingResponse:
+    """Stream SSE frames, gzipped when the client accepts it"""
+    
+    headers = {
+        "Cache-Control": "no-cache",
+        "Connection": "keep-alive",
+        "Vary": "Accept-Encoding",
+    }
+    
+    # GZipMiddleware skips text/event-stream, so the stream compresses itself
+    if _accepts_gzip(accept_encoding):
+        events = _gzip_events(events)
+        headers["Content-Encoding"] = "gzip"
+    
+    return StreamingResponse(events, media_type="text/event-stream", headers=headers)
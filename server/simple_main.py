@@ -7,12 +7,16 @@ Focus on LLM integration while services are being set up
 import os
 import asyncio
 import logging
-import json
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import StreamingResponse
+import httpx
+import msgspec
+from fastapi import Depends, FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from fastapi.middleware.gzip import GZipMiddleware
+from typing import List, Dict, Any, Optional, AsyncGenerator
+
+from config import config
+from services.request_body import msgspec_body
+from services.sse import sse_event, sse_response
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -24,26 +28,36 @@ app = FastAPI(title="ContentIQ Services (Simplified)", version="1.0.0")
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=config.ALLOWED_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["Content-Type", "Authorization"],
 )
 
+# Compress JSON responses; a fast level keeps per-response latency low
+app.add_middleware(GZipMiddleware, minimum_size=500, compresslevel=1)
+
 # Request/Response Models
-class ChatMessage(BaseModel):
+# LLM request bodies are msgspec Structs decoded by msgspec_body (hot path)
+class ChatMessage(msgspec.Struct):
     role: str
     content: str
 
-class GenerateRequest(BaseModel):
+class GenerateRequest(msgspec.Struct):
     messages: List[ChatMessage]
     content_context: Optional[List[Dict[str, Any]]] = None
     stream: bool = False
 
-class ContentGapAnalysisRequest(BaseModel):
+class ContentGapAnalysisRequest(msgspec.Struct):
     query: str
     available_content: List[Dict[str, Any]]
 
+# System prompt shared by every request (never mutated)
+_SYSTEM_MSG = {
+    "role": "system", 
+    "content": "You are ContentIQ, a helpful AI assistant that helps with content and travel information."
+}
+
 # Initialize LLM clients
 groq_api_key = os.getenv("GROQ_API_KEY")
 openai_api_key = os.getenv("OPENAI_API_KEY")
@@ -51,12 +65,28 @@ openai_api_key = os.getenv("OPENAI_API_KEY")
 groq_client = None
 openai_client = None
 
+# Cap concurrent upstream calls at the providers' rate limits
+groq_semaphore = asyncio.Semaphore(int(os.getenv("GROQ_CONCURRENCY", "20")))
+openai_semaphore = asyncio.Semaphore(int(os.getenv("OPENAI_CONCURRENCY", "20")))
+
+# Shared keep-alive connection pool for both providers
+http_client = httpx.AsyncClient(
+    limits=httpx.Limits(
+        max_connections=100,
+        max_keepalive_connections=100,
+        keepalive_expiry=30
+    ),
+    http2=True,
+    timeout=httpx.Timeout(60.0, connect=5.0)
+)
+
 if groq_api_key:
     try:
         import openai
         groq_client = openai.AsyncOpenAI(
             api_key=groq_api_key,
-            base_url="https://api.groq.com/openai/v1"
+            base_url="https://api.groq.com/openai/v1",
+            http_client=http_client
         )
         logger.info("Groq client initialized")
     except Exception as e:
@@ -65,11 +95,15 @@ if groq_api_key:
 if openai_api_key:
     try:
         import openai
-        openai_client = openai.AsyncOpenAI(api_key=openai_api_key)
+        openai_client = openai.AsyncOpenAI(api_key=openai_api_key, http_client=http_client)
         logger.info("OpenAI client initialized")
     except Exception as e:
         logger.warning(f"OpenAI initialization failed: {e}")
 
+@app.on_event("shutdown")
+async def shutdown():
+    await http_client.aclose()
+
 # Health check
 @app.get("/health")
 async def health_check():
@@ -85,52 +119,58 @@ async def generate_with_groq(messages, stream=False):
     if not groq_client:
         raise Exception("Groq client not available")
         
-    response = await groq_client.chat.completions.create(
-        model="llama3-8b-8192",
-        messages=[{"role": msg["role"], "content": msg["content"]} for msg in messages],
-        temperature=0.7,
-        max_tokens=1024,
-        stream=stream
-    )
+    async with groq_semaphore:
+        response = await groq_client.chat.completions.create(
+            model="llama3-8b-8192",
+            messages=messages,
+            temperature=0.7,
+            max_tokens=1024,
+            stream=stream
+        )
+        
+        if stream:
+            # Keep the permit until the token stream has been fully read
+            async for chunk in response:
+                if chunk.choices[0].delta.content:
+                    yield {
+                        "chunk": chunk.choices[0].delta.content,
+                        "done": False,
+                        "provider": "groq"
+                    }
+            content = ""
+        else:
+            content = response.choices[0].message.content
     
-    if stream:
-        async for chunk in response:
-            if chunk.choices[0].delta.content:
-                yield {
-                    "chunk": chunk.choices[0].delta.content,
-                    "done": False,
-                    "provider": "groq"
-                }
-        yield {"chunk": "", "done": True, "provider": "groq"}
-    else:
-        content = response.choices[0].message.content
-        yield {"chunk": content, "done": True, "provider": "groq"}
+    yield {"chunk": content, "done": True, "provider": "groq"}
 
 async def generate_with_openai(messages, stream=False):
     """Generate response using OpenAI"""
     if not openai_client:
         raise Exception("OpenAI client not available")
         
-    response = await openai_client.chat.completions.create(
-        model="gpt-4",  # Using stable model
-        messages=[{"role": msg["role"], "content": msg["content"]} for msg in messages],
-        temperature=0.7,
-        max_tokens=1024,
-        stream=stream
-    )
+    async with openai_semaphore:
+        response = await openai_client.chat.completions.create(
+            model="gpt-4",  # Using stable model
+            messages=messages,
+            temperature=0.7,
+            max_tokens=1024,
+            stream=stream
+        )
+        
+        if stream:
+            # Keep the permit until the token stream has been fully read
+            async for chunk in response:
+                if chunk.choices[0].delta.content:
+                    yield {
+                        "chunk": chunk.choices[0].delta.content,
+                        "done": False,
+                        "provider": "openai"
+                    }
+            content = ""
+        else:
+            content = response.choices[0].message.content
     
-    if stream:
-        async for chunk in response:
-            if chunk.choices[0].delta.content:
-                yield {
-                    "chunk": chunk.choices[0].delta.content,
-                    "done": False,
-                    "provider": "openai"
-                }
-        yield {"chunk": "", "done": True, "provider": "openai"}
-    else:
-        content = response.choices[0].message.content
-        yield {"chunk": content, "done": True, "provider": "openai"}
+    yield {"chunk": content, "done": True, "provider": "openai"}
 
 async def generate_response_with_fallback(messages, stream=False):
     """Generate response with Groq primary, OpenAI fallback"""
@@ -161,61 +201,41 @@ async def generate_response_with_fallback(messages, stream=False):
 
 # LLM Service Endpoints
 @app.post("/api/llm/generate")
-async def generate_response(request: GenerateRequest):
+async def generate_response(request: GenerateRequest = Depends(msgspec_body(GenerateRequest))):
     """Generate AI response (non-streaming)"""
     try:
-        messages = [{"role": msg.role, "content": msg.content} for msg in request.messages]
-        
         # Add system prompt for ContentIQ
-        system_message = {
-            "role": "system", 
-            "content": "You are ContentIQ, a helpful AI assistant that helps with content and travel information."
-        }
-        messages.insert(0, system_message)
+        messages = [_SYSTEM_MSG, *msgspec.to_builtins(request.messages)]
         
-        response_chunks = []
+        last_chunk = None
         async for chunk in generate_response_with_fallback(messages, stream=False):
-            response_chunks.append(chunk)
+            last_chunk = chunk
         
-        return response_chunks[-1] if response_chunks else {"error": "No response generated"}
+        return last_chunk or {"error": "No response generated"}
         
     except Exception as e:
         logger.error(f"LLM generation error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/llm/generate/stream")
-async def generate_response_stream(request: GenerateRequest):
+async def generate_response_stream(request: GenerateRequest = Depends(msgspec_body(GenerateRequest)), accept_encoding: str = Header("")):
     """Generate AI response (streaming)"""
     try:
-        messages = [{"role": msg.role, "content": msg.content} for msg in request.messages]
-        
         # Add system prompt for ContentIQ
-        system_message = {
-            "role": "system", 
-            "content": "You are ContentIQ, a helpful AI assistant that helps with content and travel information."
-        }
-        messages.insert(0, system_message)
+        messages = [_SYSTEM_MSG, *msgspec.to_builtins(request.messages)]
         
-        async def stream_generator():
+        async def stream_generator() -> AsyncGenerator[bytes, None]:
             async for chunk in generate_response_with_fallback(messages, stream=True):
-                yield f"data: {json.dumps(chunk)}\n\n"
+                yield sse_event(chunk)
         
-        return StreamingResponse(
-            stream_generator(), 
-            media_type="text/event-stream",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "Access-Control-Allow-Origin": "*",
-            }
-        )
+        return sse_response(stream_generator(), accept_encoding)
         
     except Exception as e:
         logger.error(f"LLM streaming error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/llm/analyze-content-gap")
-async def analyze_content_gap(request: ContentGapAnalysisRequest):
+async def analyze_content_gap(request: ContentGapAnalysisRequest = Depends(msgspec_body(ContentGapAnalysisRequest))):
     """Analyze content gap for a query"""
     try:
         # Simple analysis - real implementation would use LLM
@@ -309,4 +329,11 @@ if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PYTHON_PORT", "8001"))
     logger.info(f"Starting ContentIQ Python services on port {port}")
-    uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
+    uvicorn.run(
+        "simple_main:app",
+        host="0.0.0.0",
+        port=port,
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", "1"))
+    )
\ No newline at end of file